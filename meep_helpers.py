@@ -3,9 +3,78 @@ Meep Helper Functions for Testing and Analysis
 Jeremy Howard Style: Write tests, know what to expect!
 """
 
+import sys
+from collections import OrderedDict
+from dataclasses import dataclass
+
 import numpy as np
 import matplotlib.pyplot as plt
-from typing import Tuple, Dict, Any
+from numpy.typing import ArrayLike
+from typing import Tuple, Dict, Any, Union
+
+try:
+    from scipy import fft as _fft
+except ImportError:  # scipy is optional; numpy.fft has the same interface
+    _fft = np.fft
+
+
+def _as_single(field: np.ndarray) -> np.ndarray:
+    """Contiguous single-precision view/copy of a field array."""
+    dtype = np.complex64 if np.iscomplexobj(field) else np.float32
+    return np.ascontiguousarray(field, dtype=dtype)
+
+
+def _power_sum(field: np.ndarray, subscripts: str = 'ij,ij->') -> float:
+    """Sum of |E|² without building an |E|² (or conjugate) temporary."""
+    # Complex fields: |E|² = Re² + Im², summed over strided views
+    if np.iscomplexobj(field):
+        return (np.einsum(subscripts, field.real, field.real)
+                + np.einsum(subscripts, field.imag, field.imag))
+    return np.einsum(subscripts, field, field)
+
+
+def _grid_step(ny: int, cell_size: Any) -> float:
+    """Spacing of the uniform ny-point grid spanning the cell in y."""
+    # A single point sits at -L/2; any nonzero step keeps it at index 0
+    return cell_size.y / max(ny - 1, 1)
+
+
+def _grid_index(y: float, ny: int, cell_size: Any) -> float:
+    """Fractional index of position y on the uniform grid spanning the cell."""
+    return (y + cell_size.y/2) / _grid_step(ny, cell_size)
+
+
+def _core_bounds(ny: int, waveguide_width: float,
+                 cell_size: Any) -> Tuple[int, int]:
+    """Column range [lo, hi) of the grid with |y| < waveguide_width/2."""
+    # The grid is uniform, so |y| < w/2 is a contiguous column range whose
+    # bounds follow directly from the geometry (no y array needed)
+    lo = int(np.floor(_grid_index(-waveguide_width/2, ny, cell_size))) + 1
+    hi = int(np.ceil(_grid_index(waveguide_width/2, ny, cell_size)))
+    return max(lo, 0), min(hi, ny)
+
+
+def _block_mean(a: np.ndarray, sx: int, sy: int) -> np.ndarray:
+    """Average a 2D array over sx-by-sy blocks (edge blocks may be partial)."""
+    if sx == 1 and sy == 1:
+        return a
+    # Block means instead of striding, so oscillating fields don't alias
+    ix = np.arange(0, a.shape[0], sx)
+    iy = np.arange(0, a.shape[1], sy)
+    sums = np.add.reduceat(np.add.reduceat(a, ix, axis=0), iy, axis=1)
+    counts = np.outer(np.diff(ix, append=a.shape[0]),
+                      np.diff(iy, append=a.shape[1]))
+    return sums / counts
+
+
+@dataclass(frozen=True, slots=True)
+class TestResult:
+    """Outcome of a single WaveguideTests check."""
+    test: str
+    measured: Any
+    expected: str
+    passed: bool
+    message: str
 
 
 class WaveguideTests:
@@ -47,67 +116,120 @@ class WaveguideTests:
         --------
         bool : True if test passes
         """
-        ny = field_data.shape[1]
-        y_positions = np.linspace(-cell_size.y/2, cell_size.y/2, ny)
+        lo, hi = _core_bounds(field_data.shape[1], waveguide_width, cell_size)
 
         # Power is proportional to |E|²
-        power = np.abs(field_data)**2
-        total_power = np.sum(power)
+        total_power = _power_sum(field_data)
 
         # Power in waveguide
-        mask = np.abs(y_positions) < waveguide_width/2
-        waveguide_power = np.sum(power[:, mask])
+        waveguide_power = _power_sum(field_data[:, lo:hi])
 
         gamma = waveguide_power / total_power
         passed = gamma >= expected
 
-        result = {
-            'test': 'Confinement Factor',
-            'measured': gamma,
-            'expected': f'>= {expected}',
-            'passed': passed,
-            'message': f"Γ = {gamma:.1%} ({'PASS' if passed else 'FAIL'})"
-        }
+        result = TestResult(
+            test='Confinement Factor',
+            measured=gamma,
+            expected=f'>= {expected}',
+            passed=passed,
+            message=f"Γ = {gamma:.1%} ({'PASS' if passed else 'FAIL'})"
+        )
         self.results.append(result)
 
         return passed
 
-    def test_single_mode_condition(self, width: float,
-                                   wavelength: float,
-                                   n_core: float,
-                                   n_cladding: float = 1.0) -> bool:
+    def test_confinement_factor_batch(self, fields_batch: np.ndarray,
+                                      waveguide_width: float,
+                                      cell_size: Any,
+                                      expected: float = 0.8) -> np.ndarray:
+        """
+        Test confinement for a stack of field snapshots at once.
+
+        Same check as test_confinement_factor, but all snapshots are reduced
+        in a single pass. One result is recorded per snapshot.
+
+        Parameters:
+        -----------
+        fields_batch : ndarray
+            3D array of field values (Ez), shape (N, nx, ny)
+        waveguide_width : float
+            Width of the waveguide in micrometers
+        cell_size : mp.Vector3
+            Size of the computational cell
+        expected : float
+            Minimum expected confinement factor (0-1)
+
+        Returns:
+        --------
+        ndarray : Confinement factor Γ for each snapshot
+        """
+        lo, hi = _core_bounds(fields_batch.shape[2], waveguide_width, cell_size)
+
+        total_power = _power_sum(fields_batch, 'nij,nij->n')
+        waveguide_power = _power_sum(fields_batch[:, :, lo:hi], 'nij,nij->n')
+
+        gammas = waveguide_power / total_power
+
+        for gamma in gammas:
+            passed = gamma >= expected
+            result = TestResult(
+                test='Confinement Factor',
+                measured=gamma,
+                expected=f'>= {expected}',
+                passed=passed,
+                message=f"Γ = {gamma:.1%} ({'PASS' if passed else 'FAIL'})"
+            )
+            self.results.append(result)
+
+        return gammas
+
+    def test_single_mode_condition(self, width: ArrayLike,
+                                   wavelength: ArrayLike,
+                                   n_core: ArrayLike,
+                                   n_cladding: ArrayLike = 1.0
+                                   ) -> Union[bool, np.ndarray]:
         """
         Test if waveguide operates in single-mode regime.
 
         Expected: V-number < π/2 for single mode.
 
+        All parameters may be arrays; they are broadcast together so a whole
+        design sweep is checked in one call, with one result per combination.
+
         Parameters:
         -----------
-        width : float
+        width : float or array_like
             Waveguide width in micrometers
-        wavelength : float
+        wavelength : float or array_like
             Vacuum wavelength in micrometers
-        n_core : float
+        n_core : float or array_like
             Refractive index of waveguide core
-        n_cladding : float
+        n_cladding : float or array_like
             Refractive index of cladding (default: 1.0 for air)
 
         Returns:
         --------
-        bool : True if single-mode
+        bool or ndarray : True if single-mode (array for array inputs)
         """
-        V = (np.pi * width / wavelength) * np.sqrt(n_core**2 - n_cladding**2)
+        width, wavelength, n_core, n_cladding = (
+            np.asarray(x, dtype=float)
+            for x in (width, wavelength, n_core, n_cladding))
+
+        # (n_core - n_cl)(n_core + n_cl) avoids cancellation at low contrast
+        V = (np.pi * width / wavelength) * np.sqrt((n_core - n_cladding)
+                                                   * (n_core + n_cladding))
         cutoff = np.pi / 2
         passed = V < cutoff
 
-        result = {
-            'test': 'Single-Mode Condition',
-            'measured': V,
-            'expected': f'< {cutoff:.3f}',
-            'passed': passed,
-            'message': f"V = {V:.3f} ({'Single-mode PASS' if passed else 'Multi-mode FAIL'})"
-        }
-        self.results.append(result)
+        for v, p in zip(V.flat, passed.flat):
+            result = TestResult(
+                test='Single-Mode Condition',
+                measured=v,
+                expected=f'< {cutoff:.3f}',
+                passed=p,
+                message=f"V = {v:.3f} ({'Single-mode PASS' if p else 'Multi-mode FAIL'})"
+            )
+            self.results.append(result)
 
         return passed
 
@@ -132,16 +254,21 @@ class WaveguideTests:
         --------
         bool : True if in range
         """
-        max_field = np.max(np.abs(field_data))
+        field_data = np.asarray(field_data)
+        if np.iscomplexobj(field_data):
+            max_field = np.max(np.abs(field_data))
+        else:
+            # max |E| from two reductions, without an |E| temporary
+            max_field = max(field_data.max(), -field_data.min())
         passed = min_val < max_field < max_val
 
-        result = {
-            'test': 'Field Amplitude',
-            'measured': max_field,
-            'expected': f'{min_val} < |E| < {max_val}',
-            'passed': passed,
-            'message': f"|Ez|_max = {max_field:.4f} ({'PASS' if passed else 'FAIL'})"
-        }
+        result = TestResult(
+            test='Field Amplitude',
+            measured=max_field,
+            expected=f'{min_val} < |E| < {max_val}',
+            passed=passed,
+            message=f"|Ez|_max = {max_field:.4f} ({'PASS' if passed else 'FAIL'})"
+        )
         self.results.append(result)
 
         return passed
@@ -170,13 +297,13 @@ class WaveguideTests:
         cycles = simulation_time * frequency
         passed = cycles >= min_cycles
 
-        result = {
-            'test': 'Steady-State Convergence',
-            'measured': cycles,
-            'expected': f'>= {min_cycles}',
-            'passed': passed,
-            'message': f"{cycles:.1f} cycles ({'PASS' if passed else 'WARNING: may not converge'})"
-        }
+        result = TestResult(
+            test='Steady-State Convergence',
+            measured=cycles,
+            expected=f'>= {min_cycles}',
+            passed=passed,
+            message=f"{cycles:.1f} cycles ({'PASS' if passed else 'WARNING: may not converge'})"
+        )
         self.results.append(result)
 
         return passed
@@ -205,41 +332,44 @@ class WaveguideTests:
         ppw = resolution * wavelength
         passed = ppw >= min_ppw
 
-        result = {
-            'test': 'Resolution',
-            'measured': ppw,
-            'expected': f'>= {min_ppw}',
-            'passed': passed,
-            'message': f"{ppw:.1f} pixels/wavelength ({'PASS' if passed else 'FAIL: too coarse'})"
-        }
+        result = TestResult(
+            test='Resolution',
+            measured=ppw,
+            expected=f'>= {min_ppw}',
+            passed=passed,
+            message=f"{ppw:.1f} pixels/wavelength ({'PASS' if passed else 'FAIL: too coarse'})"
+        )
         self.results.append(result)
 
         return passed
 
     def print_report(self):
         """Print a formatted test report."""
-        print("\n" + "="*70)
-        print("SIMULATION TEST REPORT")
-        print("="*70)
+        lines = ["\n" + "="*70, "SIMULATION TEST REPORT", "="*70]
 
+        # Count passes while formatting, and emit the report in one write
+        passed_count = 0
         for i, result in enumerate(self.results, 1):
-            status = "✓" if result['passed'] else "✗"
-            print(f"\n{status} Test {i}: {result['test']}")
-            print(f"  Measured: {result['measured']}")
-            print(f"  Expected: {result['expected']}")
-            print(f"  {result['message']}")
+            passed_count += bool(result.passed)
+            status = "✓" if result.passed else "✗"
+            lines.append(f"\n{status} Test {i}: {result.test}")
+            lines.append(f"  Measured: {result.measured}")
+            lines.append(f"  Expected: {result.expected}")
+            lines.append(f"  {result.message}")
 
-        passed_count = sum(r['passed'] for r in self.results)
         total_count = len(self.results)
 
-        print("\n" + "="*70)
-        print(f"SUMMARY: {passed_count}/{total_count} tests passed")
+        lines.append("\n" + "="*70)
+        lines.append(f"SUMMARY: {passed_count}/{total_count} tests passed")
 
         if passed_count == total_count:
-            print("🎉 ALL TESTS PASSED!")
+            lines.append("🎉 ALL TESTS PASSED!")
         else:
-            print("⚠️  Some tests failed - review results above")
-        print("="*70 + "\n")
+            lines.append("⚠️  Some tests failed - review results above")
+        lines.append("="*70 + "\n")
+
+        sys.stdout.write("\n".join(lines) + "\n")
+        sys.stdout.flush()
 
 
 class WaveguideAnalysis:
@@ -269,11 +399,16 @@ class WaveguideAnalysis:
         """
         # Take cross-section along x at y=0
         mid_y = field_data.shape[1] // 2
-        field_x = field_data[:, mid_y]
+        field_x = _as_single(field_data[:, mid_y])
 
-        # FFT to find spatial frequency
-        fft = np.fft.fft(field_x)
-        freqs = np.fft.fftfreq(len(field_x), d=cell_size.x/len(field_x))
+        # FFT to find spatial frequency (real input: positive half suffices)
+        d = cell_size.x/len(field_x)
+        if np.iscomplexobj(field_x):
+            fft = _fft.fft(field_x)
+            freqs = _fft.fftfreq(len(field_x), d=d)
+        else:
+            fft = _fft.rfft(field_x)
+            freqs = _fft.rfftfreq(len(field_x), d=d)
 
         # Find dominant spatial frequency (skip DC)
         dominant_idx = np.argmax(np.abs(fft[1:])) + 1
@@ -308,28 +443,26 @@ class WaveguideAnalysis:
         float : Decay length in micrometers
         """
         mid_x = field_data.shape[0] // 2
-        cross_section = np.abs(field_data[mid_x, :])
-
-        y = np.linspace(-cell_size.y/2, cell_size.y/2, len(cross_section))
-
-        # Find edge of waveguide
-        edge_idx = np.argmin(np.abs(y - waveguide_width/2))
-        edge_field = cross_section[edge_idx]
+        ny = field_data.shape[1]
 
-        # Find 1/e point
-        target = edge_field / np.e
+        # Find edge of waveguide (nearest grid point to y = w/2, lower on ties)
+        edge_idx = int(np.ceil(_grid_index(waveguide_width/2, ny, cell_size) - 0.5))
+        edge_idx = min(max(edge_idx, 0), ny - 1)
 
-        # Look outside waveguide
-        outside_idx = edge_idx + np.argmin(np.abs(cross_section[edge_idx:] - target))
+        # Look outside waveguide for the 1/e point
+        outside = np.abs(field_data[mid_x, edge_idx:])
+        target = outside[0] / np.e
+        offset = np.argmin(np.abs(outside - target))
 
-        decay_length = abs(y[outside_idx] - y[edge_idx])
-        return decay_length
+        decay_length = offset * _grid_step(ny, cell_size)
+        return float(decay_length)
 
     @staticmethod
     def plot_mode_profile(field_data: np.ndarray,
                          waveguide_width: float,
                          cell_size: Any,
-                         title: str = "Mode Profile"):
+                         title: str = "Mode Profile",
+                         display_size: int = 800):
         """
         Plot the waveguide mode profile.
 
@@ -345,12 +478,17 @@ class WaveguideAnalysis:
             Cell size
         title : str
             Plot title
+        display_size : int
+            Max pixels per axis for the 2D field image; larger fields are
+            block-averaged down to at most this size before drawing
         """
         fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(14, 5))
 
         # Plot 1: 2D field
         extent = [-cell_size.x/2, cell_size.x/2, -cell_size.y/2, cell_size.y/2]
-        im = ax1.imshow(field_data.T, extent=extent, cmap='RdBu',
+        sx = -(-field_data.shape[0] // display_size)
+        sy = -(-field_data.shape[1] // display_size)
+        im = ax1.imshow(_block_mean(field_data, sx, sy).T, extent=extent, cmap='RdBu',
                        origin='lower', aspect='auto')
         ax1.axhline(y=waveguide_width/2, color='white', linestyle='--', alpha=0.5)
         ax1.axhline(y=-waveguide_width/2, color='white', linestyle='--', alpha=0.5)
@@ -380,6 +518,17 @@ class WaveguideAnalysis:
         plt.show()
 
 
+# Dielectric maps from quick_waveguide_simulation, keyed by geometry and
+# kept in least-recently-used order so sweeps hold at most a few of them
+_EPS_CACHE = OrderedDict()
+_EPS_CACHE_SIZE = 4
+
+
+def clear_eps_cache():
+    """Release all dielectric maps cached by quick_waveguide_simulation."""
+    _EPS_CACHE.clear()
+
+
 def quick_waveguide_simulation(width: float = 1.0,
                                frequency: float = 0.15,
                                epsilon: float = 12,
@@ -406,6 +555,9 @@ def quick_waveguide_simulation(width: float = 1.0,
     Returns:
     --------
     dict : Contains simulation object and field data
+        ('eps_data' is read-only and shared between calls with the same
+        geometry; the last few geometries stay cached until
+        clear_eps_cache() is called)
 
     Example:
     --------
@@ -447,11 +599,30 @@ def quick_waveguide_simulation(width: float = 1.0,
     sim.run(until=runtime)
     print("✅ Simulation complete!")
 
-    # Get field data
-    ez_data = sim.get_array(center=mp.Vector3(0, 0, 0),
-                           size=cell_size, component=mp.Ez)
-    eps_data = sim.get_array(center=mp.Vector3(0, 0, 0),
-                            size=cell_size, component=mp.Dielectric)
+    # Get field data. Both slices share one double-precision buffer: it is
+    # sized by the first get_array and refilled in place via arr= for the
+    # second, after each is copied out in single precision (plenty for
+    # visualization and mode analysis). Complex Ez (complex-field sims)
+    # stays complex; the real dielectric map then gets its own array
+    buf = sim.get_array(center=mp.Vector3(0, 0, 0),
+                        size=cell_size, component=mp.Ez)
+    ez_data = _as_single(buf)
+    eps_buf = None if np.iscomplexobj(buf) else buf
+
+    # The dielectric map depends only on the geometry, so sweeps over
+    # frequency or runtime reuse it (read-only) instead of fetching again
+    eps_key = (width, epsilon, resolution, cell_size.x, cell_size.y)
+    eps_data = _EPS_CACHE.get(eps_key)
+    if eps_data is None:
+        eps_data = _as_single(
+            sim.get_array(center=mp.Vector3(0, 0, 0), size=cell_size,
+                          component=mp.Dielectric, arr=eps_buf))
+        eps_data.flags.writeable = False
+        _EPS_CACHE[eps_key] = eps_data
+        if len(_EPS_CACHE) > _EPS_CACHE_SIZE:
+            _EPS_CACHE.popitem(last=False)
+    else:
+        _EPS_CACHE.move_to_end(eps_key)
 
     # Run tests
     tests = WaveguideTests()
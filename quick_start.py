@@ -144,7 +144,7 @@ if __name__ == "__main__":
         print(f"\n\n✗ ERROR: {e}")
         print("\nIf you're stuck:")
         print("  1. Check that all dependencies are installed (see README.md)")
-        print("  2. Make sure you're using Python 3.8+")
+        print("  2. Make sure you're using Python 3.10+")
         print("  3. Try running in a fresh conda environment")
         import traceback
         print("\nFull error traceback:")